@@ -15,8 +15,20 @@
 import os
 import json
 import uuid
+import hashlib
+import io
+import atexit
+import queue
+import threading
+import time
 import traceback
+import orjson
+import redis
+from cachetools import LRUCache, TTLCache
+from concurrent.futures import ThreadPoolExecutor
 from flask import Flask, request, jsonify, render_template
+from flask.json.provider import DefaultJSONProvider
+from flask_compress import Compress
 from dotenv import load_dotenv
 from google import genai
 from google.genai import types
@@ -26,17 +38,39 @@ from sqlalchemy import create_engine, text
 # Load environment variables from .env
 load_dotenv()
 
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Serializes jsonify() responses with orjson; falls back to Flask's default() for other types."""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
+
+# Brotli where the browser supports it, gzip otherwise
+app.config["COMPRESS_ALGORITHM"] = ["br", "gzip"]
+Compress(app)
 
 # --- Configuration ---
 API_KEY = os.getenv("GEMINI_API_KEY")
 DATABASE_URL = os.getenv("DATABASE_URL")
 BUCKET_NAME = os.getenv("GCS_BUCKET_NAME")
+REDIS_URL = os.getenv("REDIS_URL") # Optional: caching is skipped when unset
+EMBEDDING_DIM = 768 # text-embedding-005 output size
 
 # Initialize Clients
 genai_client = None # Initialize to None
 storage_client = None
 engine = None #Initialize to None
+redis_client = None
+
+# Runs GCS uploads in the background so they overlap with the Gemini call
+upload_executor = ThreadPoolExecutor(max_workers=int(os.getenv("UPLOAD_WORKERS", "8")))
 
 try:
     genai_client = genai.Client(api_key=API_KEY)
@@ -47,18 +81,642 @@ try:
     
     # Increase pool size and handle disconnected sessions
     # pool_pre_ping checks if the connection is alive before using it
-    engine = create_engine(DATABASE_URL, pool_pre_ping=True)
+    # pool_recycle replaces connections before server-side idle timeouts drop them
+    # pool_use_lifo reuses the most recent (warm) connection and lets idle extras expire
+    engine = create_engine(
+        DATABASE_URL,
+        pool_pre_ping=True,
+        pool_size=int(os.getenv("DB_POOL_SIZE", "20")),
+        max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "10")),
+        pool_recycle=1800,
+        pool_use_lifo=True
+    )
 except Exception as e:
     print(f"Initialization Error: {traceback.format_exc()}")
 
+try:
+    if REDIS_URL:
+        # Short timeouts so an unreachable Redis degrades to a cache miss instead of stalling requests
+        redis_client = redis.Redis.from_url(
+            REDIS_URL,
+            socket_connect_timeout=float(os.getenv("REDIS_TIMEOUT", "0.2")),
+            socket_timeout=float(os.getenv("REDIS_TIMEOUT", "0.2"))
+        )
+except Exception as e:
+    print(f"Redis Initialization Error: {traceback.format_exc()}")
+
+
+# --- SQL Statements ---
+# Built once at import time instead of on every request
+
+ITEMS_LIST_SQL = text("""
+    SELECT item_id, title, bio, category, image_url 
+    FROM items 
+    WHERE status = 'available'
+    ORDER BY created_at DESC
+    LIMIT 20
+""")
+
+ITEM_INSERT_SQL = text("""
+    INSERT INTO items (provider_name, provider_phone, title, bio, category, image_url, status, item_vector)
+    VALUES (:name, :phone, :title, :bio, :cat, :url, 'available', CAST(:vec AS halfvec)) 
+    RETURNING item_id, owner_id
+""")
+
+EMBEDDING_SQL = text("SELECT embedding('text-embedding-005', :content)::halfvec::text")
+
+# Using Cosine Distance (<=>) for similarity
+# 1 - distance = similarity score
+# This is a pure vector ORDER BY + LIMIT so the planner can use the HNSW index.
+# q holds the (possibly cached) query embedding; the scalar subquery becomes an InitPlan.
+SEARCH_SQL = text("""
+    WITH q AS (
+        SELECT CAST(:vec AS halfvec) AS v
+    ),
+    cand AS (
+        SELECT item_id, title, bio, category, image_url,
+               item_vector <=> (SELECT v FROM q) AS d
+        FROM items
+        WHERE status = 'available' AND item_vector IS NOT NULL
+        ORDER BY d
+        LIMIT 20
+    )
+    SELECT item_id, title, bio, category, image_url, 1 - d as score
+    FROM cand
+    ORDER BY d
+""")
+
+SWIPE_INSERT_SQL = text("""
+    INSERT INTO swipes (swiper_id, item_id, direction, is_match)
+    VALUES (:swiper, :item, :dir, :match)
+""")
+
+# One multi-row INSERT for a whole batch: each column is bound as an array and unnested
+SWIPE_BATCH_INSERT_SQL = text("""
+    INSERT INTO swipes (swiper_id, item_id, direction, is_match)
+    SELECT * FROM unnest(
+        CAST(:swipers AS uuid[]),
+        CAST(:items AS uuid[]),
+        CAST(:dirs AS text[]),
+        CAST(:matches AS boolean[])
+    )
+""")
+
+# Claims the item, records the matching swipe and returns provider info in one atomic step;
+# no row means the item can't be claimed. Recording the swipe here means a claim can't be
+# committed without the swipe that made it, even if the background writer loses its queue.
+SWIPE_MATCH_SQL = text("""
+    WITH claimed AS (
+        UPDATE items SET status = 'matched'
+        WHERE item_id = :id AND status = 'available'
+        RETURNING item_id, provider_name, provider_phone
+    ),
+    recorded AS (
+        INSERT INTO swipes (swiper_id, item_id, direction, is_match)
+        SELECT CAST(:swiper AS uuid), item_id, 'right', true FROM claimed
+    )
+    SELECT provider_name, provider_phone FROM claimed
+""")
+
+# Tells an item someone else already claimed apart from one that doesn't exist
+ITEM_EXISTS_SQL = text("SELECT EXISTS (SELECT 1 FROM items WHERE item_id = :id)")
+
+MATCHES_SQL = text("""
+    SELECT s.item_id, i.title, i.image_url, i.provider_name, i.provider_phone
+    FROM swipes s
+    JOIN items i ON s.item_id = i.item_id
+    WHERE s.swiper_id = :swiper AND s.is_match = true AND i.status = 'matched'
+""")
+
+
+# Any constant works as long as every worker uses the same one
+MIGRATION_LOCK_ID = 7319071301
+
+
+def _drop_index_if(conn, index_name, condition_sql):
+    """Drops index_name if it exists and condition_sql (evaluated against pg_index) is true."""
+    should_drop = conn.execute(text(f"""
+        SELECT {condition_sql} FROM pg_index
+        WHERE indexrelid = to_regclass(:name)
+    """), {"name": index_name}).scalar()
+    if should_drop:
+        conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {index_name}"))
+
+
+def ensure_indexes(engine):
+    """
+    Creates the indexes and column settings the hot queries rely on. Safe to run on every startup:
+    one worker migrates while holding an advisory lock, the others skip it.
+    """
+    with engine.connect() as conn:
+        # Autocommit so the indexes can be built CONCURRENTLY without blocking writes to items
+        conn.execution_options(isolation_level="AUTOCOMMIT")
+
+        if not conn.execute(text("SELECT pg_try_advisory_lock(:id)"), {"id": MIGRATION_LOCK_ID}).scalar():
+            print("Index migration is running in another worker; skipping.")
+            return
+
+        try:
+            # IDs are generated by Postgres, not in Python. ITEM_INSERT_SQL relies on this, so it runs first,
+            # and only when missing: ALTER TABLE takes an ACCESS EXCLUSIVE lock on items.
+            owner_default = conn.execute(text("""
+                SELECT column_default FROM information_schema.columns
+                WHERE table_name = 'items' AND column_name = 'owner_id'
+            """)).scalar()
+            if not owner_default:
+                conn.execute(text("ALTER TABLE items ALTER COLUMN owner_id SET DEFAULT gen_random_uuid()"))
+
+            # Give the one-time index build enough memory and workers (reset in finally)
+            conn.execute(text("SET maintenance_work_mem = '2GB'"))
+            conn.execute(text("SET max_parallel_maintenance_workers = 7"))
+
+            # Store embeddings as halfvec (FP16): half the bytes per distance check and half the index size.
+            # The old vector_cosine_ops index can't survive the type change, so drop it first.
+            col_type = conn.execute(text("""
+                SELECT format_type(atttypid, atttypmod)
+                FROM pg_attribute
+                WHERE attrelid = 'items'::regclass AND attname = 'item_vector'
+            """)).scalar()
+            if col_type and not col_type.startswith("halfvec"):
+                conn.execute(text("DROP INDEX CONCURRENTLY IF EXISTS items_vec_hnsw"))
+                conn.execute(text(
+                    f"ALTER TABLE items ALTER COLUMN item_vector TYPE halfvec({EMBEDDING_DIM}) "
+                    f"USING item_vector::halfvec({EMBEDDING_DIM})"
+                ))
+
+            # A failed CONCURRENTLY build leaves an invalid index that IF NOT EXISTS would keep
+            _drop_index_if(conn, "items_vec_hnsw", "NOT indisvalid")
+            _drop_index_if(conn, "items_avail_recent", "NOT indisvalid")
+
+            # HNSW index so /api/search uses an Index Scan instead of a Seq Scan + sort.
+            # Only available items are in the graph, so matched items don't grow it.
+            conn.execute(text("""
+                CREATE INDEX CONCURRENTLY IF NOT EXISTS items_vec_hnsw
+                ON items USING hnsw (item_vector halfvec_cosine_ops)
+                WITH (m = 24, ef_construction = 128)
+                WHERE status = 'available'
+            """))
+
+            # Partial index in deck order so home / get_items read 20 rows with no sort step
+            conn.execute(text("""
+                CREATE INDEX CONCURRENTLY IF NOT EXISTS items_avail_recent
+                ON items (created_at DESC)
+                WHERE status = 'available'
+            """))
+        finally:
+            # Session settings and the lock would otherwise stay on the pooled connection
+            conn.execute(text("RESET maintenance_work_mem"))
+            conn.execute(text("RESET max_parallel_maintenance_workers"))
+            conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": MIGRATION_LOCK_ID})
+
+
+def configure_hnsw_params(vector_count):
+    """
+    Picks an hnsw.ef_search value for the current table size.
+    Larger graphs need a bigger candidate list to keep recall up.
+    """
+    if vector_count < 10000:
+        return 40
+    if vector_count < 1000000:
+        return 100
+    return 200
+
+
+def load_hnsw_ef_search(engine):
+    """
+    Returns HNSW_EF_SEARCH from the environment, or a value scaled to the size of 'items'.
+    """
+    if os.getenv("HNSW_EF_SEARCH"):
+        return int(os.getenv("HNSW_EF_SEARCH"))
+
+    with engine.connect() as conn:
+        row = conn.execute(text("SELECT reltuples FROM pg_class WHERE relname = 'items'")).fetchone()
+    # reltuples is -1 for a table that has never been analyzed
+    vector_count = max(int(row[0]), 0) if row else 0
+    return configure_hnsw_params(vector_count)
+
+
+HNSW_EF_SEARCH = 100
+
+# Separate from MIGRATION_LOCK_ID, which the migrating worker holds for the whole index build
+MATCH_TRIGGER_LOCK_ID = 7319071302
+
+def ensure_match_notifications(engine):
+    """
+    Installs a trigger that announces every recorded match on the 'match' channel,
+    with the item details get_matches returns as the JSON payload.
+    """
+    with engine.connect() as conn:
+        # Workers boot together; concurrent CREATE OR REPLACE on the same function can fail
+        conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": MATCH_TRIGGER_LOCK_ID})
+        conn.execute(text("""
+            CREATE OR REPLACE FUNCTION notify_match() RETURNS trigger AS $$
+            BEGIN
+                PERFORM pg_notify('match', json_build_object(
+                    'swiper_id', NEW.swiper_id,
+                    'item_id', i.item_id,
+                    'item_title', i.title,
+                    'item_image_url', i.image_url,
+                    'provider_name', i.provider_name,
+                    'provider_phone', i.provider_phone
+                )::text)
+                FROM items i WHERE i.item_id = NEW.item_id;
+                RETURN NEW;
+            END;
+            $$ LANGUAGE plpgsql
+        """))
+        conn.execute(text("""
+            CREATE OR REPLACE TRIGGER swipes_notify_match
+            AFTER INSERT ON swipes
+            FOR EACH ROW WHEN (NEW.is_match)
+            EXECUTE FUNCTION notify_match()
+        """))
+        conn.commit()
+
+
+# Each startup step is independent, so one failing doesn't skip the others
+if engine is not None:
+    try:
+        ensure_indexes(engine)
+    except Exception as e:
+        print(f"Index Setup Error: {traceback.format_exc()}")
+
+    try:
+        ensure_match_notifications(engine)
+    except Exception as e:
+        print(f"Match Notification Setup Error: {traceback.format_exc()}")
+
+    try:
+        HNSW_EF_SEARCH = load_hnsw_ef_search(engine)
+    except Exception as e:
+        print(f"ef_search Setup Error: {traceback.format_exc()}")
+
+# SET does not accept bind parameters, so the int is inlined once ef_search is known
+EF_SEARCH_SQL = text(f"SET LOCAL hnsw.ef_search = {int(HNSW_EF_SEARCH)}")
+
+
+def cache_key(prefix, data):
+    """
+    Builds a Redis key from a prefix and the sha256 of the given str, bytes or file stream.
+    Streams are hashed in chunks and rewound.
+    """
+    digest = hashlib.sha256()
+    if isinstance(data, str):
+        data = data.encode()
+    if isinstance(data, bytes):
+        digest.update(data)
+    else:
+        data.seek(0)
+        for chunk in iter(lambda: data.read(65536), b""):
+            digest.update(chunk)
+        data.seek(0)
+    return f"{prefix}:{digest.hexdigest()}"
+
+
+def cache_get(key):
+    """Returns the cached JSON value for key, or None on a miss or when Redis is unavailable."""
+    if redis_client is None:
+        return None
+    try:
+        cached = redis_client.get(key)
+        return json.loads(cached) if cached is not None else None
+    except Exception as e:
+        print(f"Cache read error: {e}")
+        return None
+
+
+def cache_set(key, value, ttl):
+    """Stores value as JSON under key for ttl seconds. Cache failures never fail the request."""
+    if redis_client is None:
+        return
+    try:
+        redis_client.setex(key, ttl, json.dumps(value))
+    except Exception as e:
+        print(f"Cache write error: {e}")
+
 
-def upload_to_gcs(file_bytes, filename):
-    """Uploads a file to Google Cloud Storage and returns the public URL."""
+# Search results are cached this long, and claimed items are remembered just as long
+SEARCH_CACHE_TTL = 300
+
+
+def mark_matched(item_id):
+    """Records that item_id was claimed, so cached search results stop returning it."""
+    cache_set(f"matched:{item_id}", True, SEARCH_CACHE_TTL)
+
+
+def drop_matched(hits):
+    """Removes hits whose item was claimed after the results were cached."""
+    if redis_client is None or not hits:
+        return hits
+    try:
+        claimed = redis_client.mget([f"matched:{hit['id']}" for hit in hits])
+    except Exception as e:
+        print(f"Cache read error: {e}")
+        return hits
+    return [hit for hit, flag in zip(hits, claimed) if flag is None]
+
+
+def get_embedding(conn, content):
+    """
+    Returns the text-embedding-005 embedding of content as a halfvec text literal,
+    cached for 24h so repeated text skips the embedding() model call.
+    """
+    key = cache_key("emb", content)
+    vec = cache_get(key)
+    if vec is None:
+        vec = conn.execute(
+            EMBEDDING_SQL,
+            {"content": content}
+        ).scalar()
+        cache_set(key, vec, 86400)
+    return vec
+
+
+PROFILE_PROMPT = """
+    You are a witty community manager for NeighborLoop. 
+    Analyze this surplus item and return JSON:
+    {
+        "bio": "First-person witty dating-style profile bio, for the product, not longer than 2 lines",
+        "category": "One-word category",
+        "tags": ["tag1", "tag2"]
+    }
+    """
+
+
+def upload_to_gemini(image_stream):
+    """Streams the image to the Gemini Files API and returns the file reference."""
+    image_stream.seek(0)
+    return genai_client.files.upload(
+        file=image_stream,
+        config=types.UploadFileConfig(mime_type="image/jpeg")
+    )
+
+
+def generate_profile(image_stream):
+    """
+    Asks Gemini for the item's bio/category/tags. The image goes through the Files API
+    and is deleted afterwards so listings don't pile up against the Files quota.
+    """
+    gemini_file = upload_to_gemini(image_stream)
+    try:
+        response = genai_client.models.generate_content(
+            model="gemini-3-flash-preview",
+            contents=[gemini_file, PROFILE_PROMPT],
+            config=types.GenerateContentConfig(response_mime_type="application/json")
+        )
+        return json.loads(response.text)
+    finally:
+        try:
+            genai_client.files.delete(name=gemini_file.name)
+        except Exception as e:
+            print(f"Gemini file cleanup error: {e}")
+
+
+class SharedStreamView(io.RawIOBase):
+    """
+    An independent read position over a shared file stream, so two uploads can
+    read the same upload concurrently without buffering it in memory.
+    """
+
+    def __init__(self, stream, lock):
+        self._stream = stream
+        self._lock = lock
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self._pos = offset
+        elif whence == io.SEEK_CUR:
+            self._pos += offset
+        else:
+            with self._lock:
+                self._pos = self._stream.seek(0, io.SEEK_END) + offset
+        return self._pos
+
+    def readinto(self, buffer):
+        with self._lock:
+            self._stream.seek(self._pos)
+            data = self._stream.read(len(buffer))
+        buffer[:len(data)] = data
+        self._pos += len(data)
+        return len(data)
+
+
+def upload_to_gcs(file_stream, filename):
+    """Streams a file to Google Cloud Storage and returns the blob (its public_url goes in the listing)."""
     bucket = storage_client.bucket(BUCKET_NAME)
     blob = bucket.blob(f"items/{uuid.uuid4()}-{filename}")
-    blob.upload_from_string(file_bytes, content_type="image/jpeg")
-    return blob.public_url
+    blob.upload_from_file(file_stream, content_type="image/jpeg", rewind=True)
+    return blob
+
+
+def discard_gcs_upload(gcs_future):
+    """
+    Cleans up the upload of a listing that failed: cancels it if it hasn't started, otherwise
+    waits for it (it reads the request stream, which Flask closes after the response) and deletes the blob.
+    """
+    if gcs_future.cancel() or gcs_future.exception() is not None:
+        return
+    try:
+        gcs_future.result().delete()
+    except Exception as e:
+        print(f"GCS cleanup error: {e}")
+
+
+
+# The deck query is the same for every visitor, so share one result for a few seconds
+items_cache = TTLCache(maxsize=1, ttl=10)
+items_cache_lock = threading.Lock()
+
+
+def _fetch_available_items():
+    """
+    Returns the 20 most recent available items for the deck.
+    The lock is held across the query on a miss, so concurrent requests wait for
+    one fetch instead of all hitting the DB when the entry expires.
+    """
+    with items_cache_lock:
+        items = items_cache.get("deck")
+        if items is not None:
+            return items
+
+        with engine.connect() as conn:
+            rows = conn.execute(ITEMS_LIST_SQL).mappings().all()
+
+        items = [{
+            "id": str(r["item_id"]),
+            "title": r["title"],
+            "bio": r["bio"],
+            "category": r["category"],
+            "image_url": r["image_url"]
+        } for r in rows]
+        items_cache["deck"] = items
+        return items
+
+
+# Non-matching swipes are written in the background: up to SWIPE_BATCH_SIZE rows or every SWIPE_FLUSH_SECONDS.
+# The queue is bounded so a slow or unreachable DB can't grow it without limit.
+SWIPE_QUEUE = queue.Queue(maxsize=int(os.getenv("SWIPE_QUEUE_SIZE", "10000")))
+SWIPE_BATCH_SIZE = 500
+SWIPE_FLUSH_SECONDS = 0.1
+SWIPE_DRAIN_SECONDS = 10
+_SWIPE_STOP = object() # Queued at exit; the writer flushes what it holds and stops
+
+
+def canonical_uuid(value):
+    """
+    Returns value as a canonical lowercase UUID string, or None if it isn't a UUID.
+    Swipes, matched:<id> cache keys and the match store all use this form.
+    """
+    try:
+        return str(uuid.UUID(str(value)))
+    except ValueError:
+        return None
+
+
+def _insert_swipes(batch):
+    """
+    Inserts a batch in one statement. If that fails, retries row by row so one
+    bad swipe (e.g. an item_id that no longer exists) doesn't drop the rest.
+    """
+    try:
+        with engine.begin() as conn:
+            conn.execute(SWIPE_BATCH_INSERT_SQL, {
+                "swipers": [s["swiper"] for s in batch],
+                "items": [s["item"] for s in batch],
+                "dirs": [s["dir"] for s in batch],
+                "matches": [s["match"] for s in batch]
+            })
+        return
+    except Exception as e:
+        print(f"Swipe batch insert error, retrying {len(batch)} swipes one by one: {e}")
+
+    for swipe in batch:
+        try:
+            with engine.begin() as conn:
+                conn.execute(SWIPE_INSERT_SQL, swipe)
+        except Exception as e:
+            print(f"Swipe dropped {swipe}: {e}")
+
+
+def _swipe_writer():
+    """Drains SWIPE_QUEUE and writes up to SWIPE_BATCH_SIZE swipes per INSERT until _SWIPE_STOP arrives."""
+    stop = False
+    while not stop:
+        batch = [SWIPE_QUEUE.get()]
+        deadline = time.monotonic() + SWIPE_FLUSH_SECONDS
+        while len(batch) < SWIPE_BATCH_SIZE and batch[-1] is not _SWIPE_STOP:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(SWIPE_QUEUE.get(timeout=remaining))
+            except queue.Empty:
+                break
 
+        if batch[-1] is _SWIPE_STOP:
+            stop = True
+            batch.pop()
+        if not batch:
+            continue
+
+        try:
+            _insert_swipes(batch)
+        except Exception as e:
+            # Keep the writer thread alive whatever happens
+            print(f"Swipe writer error: {traceback.format_exc()}")
+
+
+def queue_swipe(swipe):
+    """Hands a swipe to the background writer, or writes it inline when the queue is full."""
+    try:
+        SWIPE_QUEUE.put_nowait(swipe)
+    except queue.Full:
+        print("Swipe queue full, writing swipe inline")
+        _insert_swipes([swipe])
+
+
+def _drain_swipes(writer):
+    """Runs at exit so swipes still queued (or mid-batch) are written before the worker stops."""
+    try:
+        SWIPE_QUEUE.put(_SWIPE_STOP, timeout=SWIPE_DRAIN_SECONDS)
+    except queue.Full:
+        print(f"Swipe queue still full at exit; {SWIPE_QUEUE.qsize()} swipes may be lost")
+        return
+    writer.join(timeout=SWIPE_DRAIN_SECONDS)
+    if writer.is_alive():
+        print(f"Swipe writer did not finish at exit; {SWIPE_QUEUE.qsize()} swipes may be lost")
+
+
+# Matches per swiper ({item_id: match}), kept current by _match_listener so get_matches doesn't hit the DB.
+# A swiper is loaded from the DB on their first get_matches call; least recently used swipers are evicted.
+MATCH_POLL_SECONDS = 1
+MATCH_STORE_SWIPERS = int(os.getenv("MATCH_STORE_SWIPERS", "10000"))
+match_store = LRUCache(maxsize=MATCH_STORE_SWIPERS)
+# Swipers being loaded right now ({swiper_id: {item_id: match}}); the listener buffers their matches here
+match_loads = {}
+match_store_lock = threading.Lock()
+match_listener_alive = threading.Event()
+
+
+def _match_listener():
+    """
+    LISTENs on the 'match' channel and adds each match to match_store for swipers already loaded.
+    pg8000 only delivers notifications while a statement runs, so it polls with a cheap SELECT 1.
+    """
+    while True:
+        conn = None
+        try:
+            conn = engine.raw_connection()
+            driver_conn = conn.driver_connection
+            driver_conn.autocommit = True
+            cursor = driver_conn.cursor()
+            cursor.execute("LISTEN match")
+            match_listener_alive.set()
+
+            while True:
+                cursor.execute("SELECT 1")
+                while driver_conn.notifications:
+                    _, _, payload = driver_conn.notifications.popleft()
+                    match = json.loads(payload)
+                    swiper_id = str(match.pop("swiper_id"))
+                    with match_store_lock:
+                        # Keyed by item_id, so a match the initial load already saw isn't added twice
+                        matches = match_store.get(swiper_id)
+                        if matches is None:
+                            matches = match_loads.get(swiper_id)
+                        if matches is not None:
+                            matches[match["item_id"]] = match
+                time.sleep(MATCH_POLL_SECONDS)
+        except Exception as e:
+            print(f"Match listener error, reconnecting: {traceback.format_exc()}")
+            match_listener_alive.clear()
+            # Matches may have been missed while disconnected; reload swipers from the DB
+            with match_store_lock:
+                match_store.clear()
+                match_loads.clear()
+            if conn is not None:
+                try:
+                    conn.invalidate()
+                except Exception:
+                    pass
+            time.sleep(5)
+
+
+if engine is not None:
+    swipe_writer = threading.Thread(target=_swipe_writer, daemon=True)
+    swipe_writer.start()
+    atexit.register(_drain_swipes, swipe_writer)
+    threading.Thread(target=_match_listener, daemon=True).start()
 
 
 @app.route('/')
@@ -70,30 +728,8 @@ def home():
         return jsonify({"error": "Database engine not initialized."}), 500
 
     try:
-        with engine.connect() as conn:
-            query = text("""
-                SELECT item_id, title, bio, category, image_url 
-                FROM items 
-                WHERE status = 'available'
-                ORDER BY created_at DESC
-                LIMIT 20
-            """)
-            result = conn.execute(query)
-            
-            items = []
-            for row in result:
-                items.append({
-                    "id": str(row[0]),
-                    "title": row[1],
-                    "bio": row[2],
-                    "category": row[3],
-                    "image_url": row[4]
-                })
-            
-            # For SELECT, commit isn't required but keeps the connection handling consistent
-            conn.commit()
-            return render_template('app.html', items=items)
-            
+        return render_template('app.html', items=_fetch_available_items())
+
     except Exception as e:
         print(f"Error fetching items: {traceback.format_exc()}")
         return jsonify({
@@ -106,34 +742,27 @@ def home():
 def get_items():
     """
     Fetches available items from the database to populate the deck.
-    Standardized to use the same variable-based query execution as list_item.
+    Shares the cached fetch with home and lets browsers/CDNs reuse it for 10 seconds.
     """
     if engine is None:
         return jsonify({"error": "Database engine not initialized."}), 500
     try:
-        with engine.connect() as conn:
-            query = text("""
-                SELECT item_id, title, bio, category, image_url 
-                FROM items 
-                WHERE status = 'available'
-                ORDER BY created_at DESC
-                LIMIT 20
-            """)
-            result = conn.execute(query)
-            
-            items = []
-            for row in result:
-                items.append({
-                    "id": str(row[0]),
-                    "title": row[1],
-                    "bio": row[2],
-                    "category": row[3],
-                    "image_url": row[4]
-                })
-            
-            # For SELECT, commit isn't required but keeps the connection handling consistent
-            conn.commit()
-            return jsonify(items)
+        response = jsonify(_fetch_available_items())
+        response.headers["Cache-Control"] = "public, max-age=10"
+        response.add_etag()
+
+        # flask-compress rewrites the ETag of compressed responses to "<etag>:<algorithm>",
+        # so browsers revalidate with that form; accept it as well as the plain one
+        etag, _ = response.get_etag()
+        variants = [etag] + [f"{etag}:{algorithm}" for algorithm in app.config["COMPRESS_ALGORITHM"]]
+        matched = next((v for v in variants if v in request.if_none_match), None)
+        if matched:
+            not_modified = app.response_class(status=304)
+            not_modified.set_etag(matched)
+            not_modified.headers["Cache-Control"] = response.headers["Cache-Control"]
+            not_modified.vary.add("Accept-Encoding")
+            return not_modified
+        return response
             
     except Exception as e:
         print(f"Error fetching items: {traceback.format_exc()}")
@@ -158,58 +787,65 @@ def list_item():
     provider_phone = request.form.get('provider_phone', 'No Phone')
     item_title = request.form.get('item_title', 'No Title') 
     image_file = request.files['image']
-    image_bytes = image_file.read()
+    # Werkzeug spools large uploads to disk; read from the stream instead of loading it all into memory
+    image_stream = image_file.stream
 
+    gcs_future = None
+    listed = False
     try:
-        image_url = upload_to_gcs(image_bytes, image_file.filename)
-    except Exception as e:
-        return jsonify({"error": "GCS Upload Failed", "details": str(e)}), 500
+        # Identical images get the same profile, so reuse a previous Gemini answer
+        vision_key = cache_key("vision", image_stream)
+        profile = cache_get(vision_key)
 
-    prompt = """
-    You are a witty community manager for NeighborLoop. 
-    Analyze this surplus item and return JSON:
-    {
-        "bio": "First-person witty dating-style profile bio, for the product, not longer than 2 lines",
-        "category": "One-word category",
-        "tags": ["tag1", "tag2"]
-    }
-    """
-    
-    try:
-        response = genai_client.models.generate_content(
-            model="gemini-3-flash-preview",
-            contents=[
-                types.Part.from_bytes(data=image_bytes, mime_type="image/jpeg"),
-                prompt
-            ],
-            config=types.GenerateContentConfig(response_mime_type="application/json")
+        # GCS and Gemini each read the upload through their own view, so both run at once
+        stream_lock = threading.Lock()
+
+        # Start the GCS upload now and collect it right before the INSERT
+        gcs_future = upload_executor.submit(
+            upload_to_gcs, SharedStreamView(image_stream, stream_lock), image_file.filename
         )
-        profile = json.loads(response.text)
-        
-        generated_owner_id = str(uuid.uuid4())
-        
+
+        if profile is None:
+            profile = generate_profile(SharedStreamView(image_stream, stream_lock))
+            cache_set(vision_key, profile, 86400)
+
+        item_bio = profile.get('bio', 'No bio provided.')
+
+        # One connection for both steps. The embedding runs (and its implicit transaction ends)
+        # before the INSERT transaction opens, while the GCS upload is still in flight.
+        # Listing text rarely repeats, so it skips the Redis embedding cache.
         with engine.connect() as conn:
-            query = text("""
-                INSERT INTO items (owner_id, provider_name, provider_phone, title, bio, category, image_url, status, item_vector)
-                VALUES (:owner, :name, :phone, :title, :bio, :cat, :url, 'available', embedding('text-embedding-005', :title || ' ' || :bio)::vector) 
-                RETURNING item_id
-            """)
-            result = conn.execute(query, {
-                "owner": generated_owner_id, 
-                "name": provider_name,
-                "phone": provider_phone,
-                #"title": profile.get('title', 'Mystery Item'),
-                "title": item_title,
-                "bio": profile.get('bio', 'No bio provided.'),
-                "cat": profile.get('category', 'Misc'),
-                "url": image_url
-            })
-            item_id = result.fetchone()[0]
+            item_vector = conn.execute(EMBEDDING_SQL, {"content": f"{item_title} {item_bio}"}).scalar()
             conn.commit()
 
+            try:
+                image_url = gcs_future.result().public_url
+            except Exception as e:
+                return jsonify({"error": "GCS Upload Failed", "details": str(e)}), 500
+
+            # conn.begin() commits on success and rolls back on error
+            with conn.begin():
+                result = conn.execute(ITEM_INSERT_SQL, {
+                    "name": provider_name,
+                    "phone": provider_phone,
+                    #"title": profile.get('title', 'Mystery Item'),
+                    "title": item_title,
+                    "bio": item_bio,
+                    "cat": profile.get('category', 'Misc'),
+                    "url": image_url,
+                    "vec": item_vector
+                })
+                item_id, owner_id = result.fetchone()
+        listed = True
+
+        # Show the new item on the next deck load instead of after the TTL
+        with items_cache_lock:
+            items_cache.clear()
+
         return jsonify({
             "status": "success",
             "item_id": str(item_id),
+            "owner_id": str(owner_id),
             "image_url": image_url,
             "profile": profile
         })
@@ -221,6 +857,49 @@ def list_item():
             "details": str(e),
             "traceback": traceback.format_exc()
         }), 500
+    finally:
+        if gcs_future is not None and not listed:
+            discard_gcs_upload(gcs_future)
+
+
+def filter_hits_with_gemini(query_text, hits):
+    """
+    Asks Gemini in a single call which candidates match the user request.
+    Returns (hits, filtered); filtered is False when it fell back to the plain vector ranking.
+    """
+    if not hits:
+        return hits, True
+
+    listing = "\n".join(f'{i}. "{hit["bio"]}"' for i, hit in enumerate(hits))
+    prompt = f"""
+    The user is searching a community marketplace for: "{query_text}"
+    For each numbered item bio below, decide whether it matches the user request at least 60%.
+    Return a JSON array of exactly {len(hits)} booleans, in the same order as the items.
+
+    {listing}
+    """
+
+    try:
+        response = genai_client.models.generate_content(
+            model="gemini-3-flash-preview",
+            contents=[prompt],
+            config=types.GenerateContentConfig(
+                response_mime_type="application/json",
+                response_schema=list[bool]
+            )
+        )
+        verdicts = json.loads(response.text)
+    except Exception as e:
+        print(f"Search filter error, using vector ranking: {traceback.format_exc()}")
+        return hits, False
+
+    # Anything but one boolean per hit (an object, a short array) would silently drop results
+    if not isinstance(verdicts, list) or len(verdicts) != len(hits):
+        print(f"Search filter returned {len(verdicts) if isinstance(verdicts, list) else type(verdicts).__name__} "
+              f"verdicts for {len(hits)} hits, using vector ranking")
+        return hits, False
+
+    return [hit for hit, keep in zip(hits, verdicts) if keep is True], True
 
 
 @app.route('/api/search', methods=['GET'])
@@ -241,35 +920,37 @@ def search():
     if not query_vector:
         return jsonify({"error": "Failed to generate search embedding"}), 500
     '''
+    search_key = cache_key("search", query_text)
+    cached_hits = cache_get(search_key)
+    if cached_hits is not None:
+        return jsonify(drop_matched(cached_hits))
+
     try:
         with engine.connect() as conn:
             print(f"Searching for: {query_text}") # Log the query
+            query_vector = get_embedding(conn, query_text)
+
+            # Widen the HNSW candidate list for this transaction only
+            conn.execute(EF_SEARCH_SQL)
 
-            # Using Cosine Distance (<=>) for similarity
-            # 1 - distance = similarity score
-            search_sql = text("""
-                SELECT item_id, title, bio, category, image_url, 1 - (item_vector <=> embedding('text-embedding-005', :query)::vector) as score
-                FROM items 
-                WHERE status = 'available' AND item_vector IS NOT NULL and 
-                ai.if(
-                    prompt => 'Does this text: "' || bio ||'" match the user request: "' ||  :query || '", at least 60%? " ',
-                    model_id => 'gemini-3-flash-preview')  
-                ORDER BY item_vector <=> embedding('text-embedding-005', :query)::vector
-                LIMIT 5
-            """)
-            result = conn.execute(search_sql, {"query": query_text})
+            rows = conn.execute(SEARCH_SQL, {"vec": query_vector}).mappings().all()
             
-            hits = []
-            for row in result:
-                hits.append({
-                    "id": str(row[0]),
-                    "title": row[1],
-                    "bio": row[2],
-                    "category": row[3],
-                    "image_url": row[4],
-                    "score": round(float(row[5]), 3)
-                })
-            return jsonify(hits)
+            hits = [{
+                "id": str(r["item_id"]),
+                "title": r["title"],
+                "bio": r["bio"],
+                "category": r["category"],
+                "image_url": r["image_url"],
+                "score": round(float(r["score"]), 3)
+            } for r in rows]
+
+        # The LLM relevance check runs once over all candidates, outside the DB connection
+        hits, filtered = filter_hits_with_gemini(query_text, hits)
+        hits = hits[:5]
+        # Don't pin degraded (unfiltered) results in the cache during a Gemini outage
+        if filtered:
+            cache_set(search_key, hits, SEARCH_CACHE_TTL)
+        return jsonify(hits)
     except Exception as e:
         print(f"Error during search: {traceback.format_exc()}")
         return jsonify({"error": str(e)}), 500
@@ -278,7 +959,7 @@ def search():
 @app.route('/api/swipe', methods=['POST'])
 def handle_swipe():
     """
-    Records swipe in the 'swipes' table. 
+    Records the swipe in the 'swipes' table. 
     If right swipe, updates item status and returns provider info.
     """
     if engine is None:
@@ -286,54 +967,57 @@ def handle_swipe():
 
     data = request.json
     direction = data.get('direction')
-    item_id = data.get('item_id')
-    # Generate a dummy swiper_id since we don't have login yet
-    swiper_id = str(uuid.uuid4()) 
+    item_id = canonical_uuid(data.get('item_id'))
+    # No login yet, so a swiper is identified by a cookie; new visitors (or a tampered cookie) get a fresh id
+    swiper_id = canonical_uuid(request.cookies.get('swiper_id')) or str(uuid.uuid4())
 
     if not item_id or direction not in ['left', 'right']:
         return jsonify({"error": "Invalid swipe data"}), 400
 
     try:
-        with engine.connect() as conn:
-            is_match = (direction == 'right')
-            
-            # 1. Record the swipe
-            swipe_query = text("""
-                INSERT INTO swipes (swiper_id, item_id, direction, is_match)
-                VALUES (:swiper, :item, :dir, :match)
-            """)
-            conn.execute(swipe_query, {
+        res = None
+        # 1. If it's a right swipe, mark item as 'matched', record the swipe and get provider info
+        if direction == 'right':
+            with engine.begin() as conn:
+                res = conn.execute(SWIPE_MATCH_SQL, {"id": item_id, "swiper": swiper_id}).fetchone()
+                # Only checked when the claim fails, so matches still take one statement
+                if res is None and not conn.execute(ITEM_EXISTS_SQL, {"id": item_id}).scalar():
+                    return jsonify({"error": "Item not found"}), 404
+        is_match = res is not None
+
+        if is_match:
+            mark_matched(item_id)
+        else:
+            # 2. Every other swipe goes to the background writer, which batches it into 'swipes'
+            queue_swipe({
                 "swiper": swiper_id,
                 "item": item_id,
                 "dir": direction,
-                "match": is_match
+                "match": False
             })
 
-            # 2. If it's a match, get provider info and mark item as 'matched'
-            if is_match:
-                # Fetch provider info
-                info_query = text("SELECT provider_name, provider_phone FROM items WHERE item_id = :id")
-                res = conn.execute(info_query, {"id": item_id}).fetchone()
-                
-                # Update status to remove from deck
-                update_query = text("UPDATE items SET status = 'matched' WHERE item_id = :id")
-                conn.execute(update_query, {"id": item_id})
-                
-                conn.commit()
-                
-                if res:
-                    return jsonify({
-                        "is_match": True,
-                        "provider_name": res[0],
-                        "provider_phone": res[1],
-                        "swiper_id": swiper_id
-                    })
-            
-            conn.commit()
-            return jsonify({"is_match": False,
+        if is_match:
+            response = jsonify({
+                "is_match": True,
+                "provider_name": res[0],
+                "provider_phone": res[1],
+                "swiper_id": swiper_id
+            })
+        elif direction == 'right':
+            # Someone else swiped right first
+            response = jsonify({"is_match": False,
+                "reason": "already_matched",
+                "swiper_id": swiper_id
+                })
+        else:
+            response = jsonify({"is_match": False,
                 "swiper_id": swiper_id
                 })
 
+        if request.cookies.get('swiper_id') != swiper_id:
+            response.set_cookie('swiper_id', swiper_id, max_age=60 * 60 * 24 * 365, httponly=True, samesite='Lax')
+        return response
+
     except Exception as e:
         print(f"Swipe error: {traceback.format_exc()}")
         return jsonify({
@@ -342,6 +1026,20 @@ def handle_swipe():
             "traceback": traceback.format_exc()
         }), 500
 
+def _query_matches(swiper_id):
+    """Loads every match for swiper_id from the database."""
+    with engine.connect() as conn:
+        rows = conn.execute(MATCHES_SQL, {"swiper": swiper_id}).mappings().all()
+
+    return [{
+        "item_id": str(r["item_id"]),
+        "item_title": r["title"],
+        "item_image_url": r["image_url"],
+        "provider_name": r["provider_name"],
+        "provider_phone": r["provider_phone"]
+    } for r in rows]
+
+
 @app.route('/api/matches', methods=['GET'])
 def get_matches():
     """
@@ -350,32 +1048,45 @@ def get_matches():
     if engine is None:
         return jsonify({"error": "Database engine not initialized."}), 500
 
-    swiper_id = request.args.get('swiper_id')
+    swiper_id = canonical_uuid(request.args.get('swiper_id'))
 
     if not swiper_id:
-        return jsonify({"error": "swiper_id is required"}), 400
+        return jsonify({"error": "A valid swiper_id is required"}), 400
 
     try:
-        with engine.connect() as conn:
-            query = text("""
-                SELECT s.item_id, i.title, i.image_url, i.provider_name, i.provider_phone
-                FROM swipes s
-                JOIN items i ON s.item_id = i.item_id
-                WHERE s.swiper_id = :swiper AND s.is_match = true AND i.status = 'matched'
-            """)
-            result = conn.execute(query, {"swiper": swiper_id})
-
-            matches = []
-            for row in result:
-                matches.append({
-                    "item_id": row[0],
-                    "item_title": row[1],
-                    "item_image_url": row[2],
-                    "provider_name": row[3],
-                    "provider_phone": row[4]
-                })
+        if not match_listener_alive.is_set():
+            return jsonify(_query_matches(swiper_id))
+
+        # Served from memory once the swiper is loaded; the listener keeps it current
+        with match_store_lock:
+            matches = match_store.get(swiper_id)
+            if matches is not None:
+                return jsonify(list(matches.values()))
+            loading = swiper_id not in match_loads
+            if loading:
+                buffered = match_loads[swiper_id] = {}
+
+        if not loading:
+            # Another request is already loading this swiper
+            return jsonify(_query_matches(swiper_id))
+
+        # The JOIN runs without the lock; matches the listener sees meanwhile are buffered and merged here
+        try:
+            matches = {m["item_id"]: m for m in _query_matches(swiper_id)}
+        except Exception:
+            with match_store_lock:
+                if match_loads.get(swiper_id) is buffered:
+                    del match_loads[swiper_id]
+            raise
 
-            return jsonify(matches)
+        with match_store_lock:
+            # A listener reconnect clears match_loads; the buffer may then have missed matches, so don't keep it
+            if match_loads.get(swiper_id) is buffered:
+                del match_loads[swiper_id]
+                matches.update(buffered)
+                if match_listener_alive.is_set():
+                    match_store[swiper_id] = matches
+        return jsonify(list(matches.values()))
 
     except Exception as e:
         print(f"Error fetching matches: {traceback.format_exc()}")